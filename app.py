@@ -1,40 +1,362 @@
 import os
 import json
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
+import base64
+import orjson
+import hashlib
+import time
+from functools import lru_cache, wraps
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from cachetools import TTLCache
+from jinja2 import FileSystemBytecodeCache
+from flask import Flask, render_template, request, redirect, url_for, flash, session, g
+from datetime import datetime, time as dtime
+from werkzeug.security import check_password_hash
 from werkzeug.middleware.proxy_fix import ProxyFix
+from flask_session import Session
+from flask_caching import Cache
+from limits import parse as parse_limit
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
 import firebase_admin
 from firebase_admin import credentials, firestore
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 import requests  # Added for resend email API
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import redis
 
 # ============================================================
 # ⚙️ FLASK CONFIGURATION
 # ============================================================
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "supersecretkey")
+app.logger.setLevel(os.environ.get("LOGLEVEL", "WARNING").upper())
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # For Vercel
 
-# Initialize Firebase
-firebase_creds_json = os.environ.get("FIREBASE_CREDENTIALS")
-if firebase_creds_json:
-    creds_dict = json.loads(firebase_creds_json)
-    cred = credentials.Certificate(creds_dict)
-    firebase_admin.initialize_app(cred)
-    db = firestore.client()  # Firestore client
-else:
-    raise ValueError("FIREBASE_CREDENTIALS environment variable not set")
+# Compiled templates are kept under the temp dir (/tmp on Vercel), which
+# survives between invocations of a warm instance. The default directory is
+# per-user with 0700 permissions, so other users can't plant bytecode in it.
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+
+def _load_firebase_credentials():
+    """Service account dict from FIREBASE_CREDENTIALS (raw or base64 JSON)."""
+    raw = os.environ.get("FIREBASE_CREDENTIALS")
+    if not raw:
+        return None
+    if not raw.lstrip().startswith("{"):
+        raw = base64.b64decode(raw)
+    return json.loads(raw)
+
+
+# Parsed once per cold start; warm invocations reuse it
+FIREBASE_CREDENTIALS = _load_firebase_credentials()
+
+
+# Firebase is initialized on first use; the client (and its gRPC channel)
+# is then reused for the life of the process
+_firebase_lock = Lock()
+
+
+def get_db():
+    db = app.extensions.get("firestore")
+    if db is None:
+        # Request and background threads can race here on a cold instance
+        with _firebase_lock:
+            db = app.extensions.get("firestore")
+            if db is None:
+                if not firebase_admin._apps:
+                    if FIREBASE_CREDENTIALS is None:
+                        raise ValueError("FIREBASE_CREDENTIALS environment variable not set")
+                    firebase_admin.initialize_app(credentials.Certificate(FIREBASE_CREDENTIALS))
+                db = app.extensions["firestore"] = firestore.client()  # Firestore client
+    return db
+
+# Redis / Vercel KV (optional) - one pool per process, reused across requests
+REDIS_URL = os.environ.get("KV_URL") or os.environ.get("REDIS_URL")
+redis_pool = (
+    redis.ConnectionPool.from_url(REDIS_URL, socket_timeout=1.0, socket_connect_timeout=1.0)
+    if REDIS_URL else None
+)
+r = redis.Redis(connection_pool=redis_pool) if redis_pool else None
 
-def send_email(to_email, subject, html_content):
-    RESEND_API_KEY = os.environ.get("RESEND_API_KEY")
-    FROM_EMAIL = os.environ.get("FROM_EMAIL")
+# Server-side sessions: the cookie only carries a session id when Redis is available
+if r is not None:
+    app.config["SESSION_TYPE"] = "redis"
+    app.config["SESSION_REDIS"] = r
+    app.config["SESSION_USE_SIGNER"] = True
+    Session(app)
 
-    url = "https://api.resend.com/emails"
-    headers = {
-        "Authorization": f"Bearer {RESEND_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
+# Whole-response cache for the anonymous pages. Passing the existing client
+# as the host makes it share the pool instead of opening its own connections.
+cache = Cache(app, config={
+    "CACHE_TYPE": "RedisCache" if r is not None else "NullCache",
+    "CACHE_REDIS_HOST": r,
+    "CACHE_DEFAULT_TIMEOUT": 300,
+})
+
+# Rate limit counters, kept in the shared Redis pool when there is one
+rate_limiter = FixedWindowRateLimiter(storage_from_string(
+    REDIS_URL or "memory://",
+    **({"connection_pool": redis_pool} if redis_pool else {}),
+))
+
+USER_CACHE_TTL = 300  # seconds; every write to a user doc also invalidates it
+
+
+def user_cache_key(uid):
+    return f"user:{uid}"
+
+
+def cached_user(fetch):
+    """Serve user dicts from Redis, falling back to ``fetch`` on a miss."""
+    @wraps(fetch)
+    def wrapper(uid):
+        if r is None:
+            return fetch(uid)
+
+        try:
+            raw = r.get(user_cache_key(uid))
+        except redis.RedisError as e:
+            app.logger.warning("User cache read failed: %s", e)
+            return fetch(uid)
+        if raw is not None:
+            return orjson.loads(raw)
+
+        user = fetch(uid)
+        if user is not None:
+            store_user(user)
+        return user
+    return wrapper
+
+
+def store_user(user):
+    if r is None:
+        return
+    try:
+        r.setex(user_cache_key(user['id']), USER_CACHE_TTL, orjson.dumps(user))
+    except redis.RedisError as e:
+        app.logger.warning("User cache write failed: %s", e)
+
+
+def invalidate_user(uid):
+    if r is None:
+        return
+    try:
+        r.delete(user_cache_key(uid))
+    except redis.RedisError as e:
+        # The stale entry expires on its own after USER_CACHE_TTL
+        app.logger.warning("User cache invalidation failed: %s", e)
+
+
+def user_key(email):
+    """Document key derived from an email, used for ``users_by_email``."""
+    return hashlib.sha1(email.strip().lower().encode()).hexdigest()
+
+
+class EmailTaken(Exception):
+    pass
+
+
+def email_ref(email):
+    # users_by_email/{key} -> {"user_id": ...}: login is a keyed GET, not a query
+    return get_db().collection('users_by_email').document(user_key(email))
+
+
+# Short-lived in-process caches that absorb repeated login attempts:
+# user_key(email) -> user id, and failed (email, password) pairs
+_email_cache = TTLCache(maxsize=10_000, ttl=30)
+_bad_login_cache = TTLCache(maxsize=10_000, ttl=10)
+_login_cache_lock = Lock()
+
+
+def _login_attempt_key(email, password):
+    return hashlib.blake2b(password.encode(), key=user_key(email).encode()).digest()
+
+
+def forget_email(email):
+    with _login_cache_lock:
+        _email_cache.pop(user_key(email), None)
+
+
+def _find_user_by_email(email):
+    key = user_key(email)
+    with _login_cache_lock:
+        uid = _email_cache.get(key)
+    if uid is not None:
+        return _get_user_doc(uid)
+
+    lookup = email_ref(email).get()
+    user = _get_user_doc(lookup.get('user_id')) if lookup.exists else None
+    if user is not None:
+        with _login_cache_lock:
+            _email_cache[key] = user['id']
+    return user
+
+
+@firestore.transactional
+def _create_user(transaction, user_data):
+    lookup_ref = email_ref(user_data['email'])
+    if lookup_ref.get(transaction=transaction).exists:
+        raise EmailTaken(user_data['email'])
+
+    user_ref = get_db().collection('users').document()
+    transaction.set(user_ref, user_data)
+    transaction.set(lookup_ref, {'user_id': user_ref.id})
+    return user_ref.id
+
+
+@firestore.transactional
+def _update_profile(transaction, user, updated_data):
+    """Update a user's profile, moving their ``users_by_email`` entry if the
+    email changed."""
+    if user_key(updated_data['email']) != user_key(user['email']):
+        new_lookup_ref = email_ref(updated_data['email'])
+        if new_lookup_ref.get(transaction=transaction).exists:
+            raise EmailTaken(updated_data['email'])
+        transaction.delete(email_ref(user['email']))
+        transaction.set(new_lookup_ref, {'user_id': user['id']})
+
+    transaction.update(get_db().collection('users').document(user['id']), updated_data)
+
+
+# Argon2 (C implementation) instead of werkzeug's PBKDF2 for new hashes
+password_hasher = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=1)
+
+
+def verify_password(stored_hash, password):
+    """Check ``password`` against an argon2 or legacy werkzeug hash."""
+    if not stored_hash.startswith("$argon2"):
+        return check_password_hash(stored_hash, password)
+    try:
+        return password_hasher.verify(stored_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def password_needs_rehash(stored_hash):
+    return not stored_hash.startswith("$argon2") or password_hasher.check_needs_rehash(stored_hash)
+
+
+@cached_user
+def _get_user_doc(uid):
+    """Load a user document from Firestore as a dict (with ``id``), or None.
+
+    The password hash is left out so it never reaches the shared cache.
+    """
+    user_doc = get_db().collection('users').document(uid).get()
+    if not user_doc.exists:
+        return None
+    user = user_doc.to_dict()
+    user.pop('password', None)
+    user['id'] = user_doc.id
+    return user
+
+
+def _get_password_hash(uid):
+    """Read a user's password hash straight from Firestore, bypassing the cache."""
+    user_doc = get_db().collection('users').document(uid).get(field_paths=['password'])
+    return (user_doc.to_dict() or {}).get('password')
+
+RESEND_API_KEY = os.environ.get("RESEND_API_KEY")
+FROM_EMAIL = os.environ.get("FROM_EMAIL")
+RESEND_URL = "https://api.resend.com/emails"
+
+# Shared HTTP session so repeated emails reuse the TLS connection to Resend
+_http = requests.Session()
+_http.headers.update({
+    "Authorization": f"Bearer {RESEND_API_KEY}",
+    "Content-Type": "application/json"
+})
+_http.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=2, backoff_factor=0.2),
+))
+
+
+@lru_cache(maxsize=1024)
+def _parse_hm(med_time_str):
+    """Parse ``HH:MM`` into ``(hour, minute)``.
+
+    ``time.fromisoformat`` is a C fast path that also range-checks, unlike
+    ``strptime`` which interprets the format string on every call. It also
+    accepts ``HH``, ``HHMM``, seconds and offsets, so the shape is checked
+    first.
+    """
+    if len(med_time_str) != 5 or med_time_str[2] != ":":
+        raise ValueError(f"Expected HH:MM, got {med_time_str!r}")
+    t = dtime.fromisoformat(med_time_str)
+    return t.hour, t.minute
+
+
+def med_minute_of_day(med_time_str):
+    hour, minute = _parse_hm(med_time_str)
+    return hour * 60 + minute
+
+
+def next_med_timestamp(med_minute):
+    """Epoch seconds of the next occurrence of ``med_minute`` (minutes after midnight)."""
+    now = datetime.now()
+    minutes_until = (med_minute - (now.hour * 60 + now.minute)) % 1440
+    return int(now.replace(second=0, microsecond=0).timestamp()) + minutes_until * 60
+
+
+# Dashboard shows the most recent logs straight from the user doc
+RECENT_LOGS_LIMIT = 100
+DASHBOARD_LOGS = 20
+HISTORY_PAGE_SIZE = 50
+
+
+def _recent_logs(transaction, user_id, user_data):
+    """The user's ``recent_logs``, rebuilt from the ``logs`` collection for
+    accounts that predate the field."""
+    if 'recent_logs' in user_data:
+        return user_data['recent_logs']
+
+    query = (
+        get_db().collection('logs')
+        .where('user_id', '==', user_id)
+        .order_by('timestamp', direction=firestore.Query.DESCENDING)
+        .limit(RECENT_LOGS_LIMIT)
+    )
+    history = [log.to_dict() for log in transaction.get(query)]
+    return [{'action': log['action'], 'timestamp': log['timestamp']} for log in reversed(history)]
+
+
+@firestore.transactional
+def _backfill_recent_logs(transaction, user_id):
+    user_ref = get_db().collection('users').document(user_id)
+    user_data = user_ref.get(transaction=transaction).to_dict() or {}
+    if 'recent_logs' in user_data:
+        return user_data['recent_logs']
+
+    recent_logs = _recent_logs(transaction, user_id, user_data)
+    transaction.update(user_ref, {'recent_logs': recent_logs})
+    return recent_logs
+
+
+@firestore.transactional
+def _write_logs(transaction, user_id, log_entries):
+    """Add logs to the ``logs`` collection and to the user's capped
+    ``recent_logs`` list in a single commit."""
+    user_ref = get_db().collection('users').document(user_id)
+    snapshot = user_ref.get(transaction=transaction)
+    recent_logs = _recent_logs(transaction, user_id, snapshot.to_dict() or {})
+
+    for log_data in log_entries:
+        recent_logs.append({'action': log_data['action'], 'timestamp': log_data['timestamp']})
+        transaction.set(get_db().collection('logs').document(), log_data)
+    transaction.update(user_ref, {'recent_logs': recent_logs[-RECENT_LOGS_LIMIT:]})
+
+
+def _record_logs(user_id, log_entries):
+    _write_logs(get_db().transaction(), user_id, log_entries)
+    invalidate_user(user_id)
+
+
+def send_email(to_email, subject, html_content):
     data = {
         "from": FROM_EMAIL,
         "to": to_email,
@@ -42,17 +364,98 @@ def send_email(to_email, subject, html_content):
         "html": html_content
     }
 
-    response = requests.post(url, headers=headers, json=data)
-    print("Email Response:", response.text)
+    response = _http.post(RESEND_URL, json=data, timeout=5)
+    if response.ok:
+        app.logger.info("Email response: %s", response.text)
+    else:
+        app.logger.error("Email to %s failed (%s): %s", to_email, response.status_code, response.text)
+
+
+# Emails run off the request thread so the Resend round-trip doesn't add
+# to the response time
+background_executor = ThreadPoolExecutor(max_workers=4)
+
+# Vercel freezes the function once the response is sent, so threads left
+# running there may never finish; do the work inline instead
+SERVERLESS = bool(os.environ.get("VERCEL"))
+
+
+def _report_background_error(future):
+    if future.exception() is not None:
+        app.logger.error("Background task failed", exc_info=future.exception())
+
+
+def run_in_background(fn, *args):
+    if SERVERLESS:
+        try:
+            fn(*args)
+        except Exception:
+            app.logger.exception("Background task failed")
+        return None
+
+    future = background_executor.submit(fn, *args)
+    future.add_done_callback(_report_background_error)
+    return future
+
+
+def login_required(view):
+    """Require a logged-in user and load them into ``g.user`` once per request.
+
+    Routes taking a ``user_id`` argument are only accessible to that user.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        uid = session.get("user_id")
+        if not uid:
+            flash("Please log in first.", "danger")
+            return redirect(url_for("login"))
+
+        if "user_id" in kwargs and kwargs["user_id"] != uid:
+            flash("Access denied.", "danger")
+            return redirect(url_for("login"))
+
+        g.user = _get_user_doc(uid)
+        if g.user is None:
+            flash("Access denied.", "danger")
+            return redirect(url_for("login"))
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@app.template_filter("humanduration")
+def humanduration(seconds):
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes = remainder // 60
+    return f"in {hours} hour(s) and {minutes} minute(s)"
 
 
 # ============================================================
 # 🌐 ROUTES
 # ============================================================
 
+def _has_flashes():
+    # Pages showing flash messages are per-user and must not be cached
+    return "_flashes" in session
+
+
+@cache.cached(timeout=300, key_prefix="page/landing")
+def _landing_page():
+    return render_template("landing.html")
+
+
+@cache.cached(timeout=300, key_prefix="page/login", unless=_has_flashes)
+def _login_page():
+    return render_template("login.html")
+
+
+@cache.cached(timeout=300, key_prefix="page/register", unless=_has_flashes)
+def _register_page():
+    return render_template("register.html")
+
+
 @app.route("/")
 def home():
-    return render_template("landing.html")
+    return _landing_page()
 
 
 @app.route("/register", methods=["GET", "POST"])
@@ -80,13 +483,13 @@ def register():
             flash("Password must be at least 6 characters.", "danger")
             return redirect(url_for("register"))
 
-        # Check if email exists
-        user_ref = db.collection('users').where('email', '==', email).limit(1).get()
-        if user_ref:
-            flash("Email already registered.", "danger")
+        try:
+            med_minute = med_minute_of_day(med_time)
+        except ValueError:
+            flash("Invalid medication time.", "danger")
             return redirect(url_for("register"))
 
-        hashed_password = generate_password_hash(password)
+        hashed_password = password_hasher.hash(password)
 
         user_data = {
             'name': name,
@@ -96,18 +499,29 @@ def register():
             'med_name': med_name,
             'dosage': dosage,
             'med_time': med_time,
-            'water_goal': int(water_goal)
+            'med_minute': med_minute,
+            'next_med_timestamp': next_med_timestamp(med_minute),
+            'water_goal': int(water_goal),
+            'recent_logs': []
         }
 
-        db.collection('users').add(user_data)
+        try:
+            _create_user(get_db().transaction(), user_data)
+        except EmailTaken:
+            flash("Email already registered.", "danger")
+            return redirect(url_for("register"))
+
+        # Attempts made before the account existed must not linger
+        with _login_cache_lock:
+            _bad_login_cache.clear()
         
         # Send welcome email (Added)
-        send_email(email, "Welcome to Medication Reminder!", f"Hi {name}, welcome! Your medication time is {med_time}.")
+        run_in_background(send_email, email, "Welcome to Medication Reminder!", f"Hi {name}, welcome! Your medication time is {med_time}.")
         
         flash("Registration successful! Please log in.", "success")
         return redirect(url_for("login"))
 
-    return render_template("register.html")
+    return _register_page()
 
 
 @app.route("/login", methods=["GET", "POST"])
@@ -116,22 +530,32 @@ def login():
         email = request.form.get("email")
         password = request.form.get("password")
 
-        user_docs = db.collection('users').where('email', '==', email).limit(1).get()
-        user = None
+        attempt = _login_attempt_key(email, password) if email and password else None
+        with _login_cache_lock:
+            known_bad = attempt is not None and attempt in _bad_login_cache
+        if known_bad:
+            flash("Invalid email or password.", "danger")
+            return redirect(url_for("login"))
+
+        user = _find_user_by_email(email) if email else None
+        stored_hash = _get_password_hash(user["id"]) if user else None
 
-        for doc in user_docs:
-            user = doc.to_dict()
-            user['id'] = doc.id  # Add doc ID as user ID
+        if stored_hash and verify_password(stored_hash, password):
+            # Upgrade legacy PBKDF2 hashes the first time the password is seen
+            if password_needs_rehash(stored_hash):
+                get_db().collection('users').document(user["id"]).update({'password': password_hasher.hash(password)})
 
-        if user and check_password_hash(user["password"], password):
             session["user_id"] = user["id"]
             flash(f"Welcome back, {user['name']}!", "success")
             return redirect(url_for("dashboard", user_id=user["id"]))
         else:
+            if attempt is not None:
+                with _login_cache_lock:
+                    _bad_login_cache[attempt] = True
             flash("Invalid email or password.", "danger")
             return redirect(url_for("login"))
 
-    return render_template("login.html")
+    return _login_page()
 
 
 @app.route("/logout")
@@ -142,104 +566,96 @@ def logout():
 
 
 @app.route("/dashboard/<user_id>")
+@login_required
 def dashboard(user_id):
-    if "user_id" not in session:
-        flash("Please log in first.", "danger")
-        return redirect(url_for("login"))
-
-    # Load the logged-in user doc
-    user_doc = db.collection('users').document(session["user_id"]).get()
-    if not user_doc.exists:
-        flash("Access denied.", "danger")
-        return redirect(url_for("login"))
-
-    user = user_doc.to_dict()
-    user['id'] = user_doc.id
-
-    # Fetch logs
-    logs = db.collection('logs').where('user_id', '==', user['id']).get()
-    log_list = [log.to_dict() for log in logs]
-
-    # Calculate next medication time
-    med_time_str = user["med_time"]
-    now = datetime.now()
-
-    today_med_time = datetime.strptime(med_time_str, "%H:%M").replace(
-        year=now.year, month=now.month, day=now.day
-    )
-
-    if now > today_med_time:
-        next_med_time = today_med_time + timedelta(days=1)
-    else:
-        next_med_time = today_med_time
-
-    diff = next_med_time - now
-    hours, remainder = divmod(diff.seconds, 3600)
-    minutes = remainder // 60
-
-    next_time = f"in {hours} hour(s) and {minutes} minute(s)"
-
-    return render_template("dashboard.html", user=user, logs=log_list, next_time=next_time)
+    user = g.user
+
+    # Recent logs are denormalized onto the user doc - no extra query.
+    # Older accounts get the field filled from the logs collection once.
+    if 'recent_logs' not in user:
+        user['recent_logs'] = _backfill_recent_logs(get_db().transaction(), user['id'])
+        invalidate_user(user['id'])
+    log_list = user['recent_logs'][-DASHBOARD_LOGS:]
+
+    # Next medication time is precomputed; roll it forward once it has passed
+    now_ts = int(time.time())
+    next_ts = user.get('next_med_timestamp')
+    if next_ts is None:
+        med_minute = user['med_minute'] if 'med_minute' in user else med_minute_of_day(user["med_time"])
+        next_ts = next_med_timestamp(med_minute)
+    elif next_ts < now_ts:
+        next_ts += 86400 * ((now_ts - next_ts) // 86400 + 1)
+    if next_ts != user.get('next_med_timestamp'):
+        get_db().collection('users').document(user['id']).update({'next_med_timestamp': next_ts})
+        invalidate_user(user['id'])
+        user['next_med_timestamp'] = next_ts
+
+    return render_template("dashboard.html", user=user, logs=log_list, now_ts=now_ts)
 
 @app.route("/view_history/<user_id>")
+@login_required
 def view_history(user_id):
-    if "user_id" not in session or session["user_id"] != user_id:
-        flash("Access denied.", "danger")
-        return redirect(url_for("login"))
-    
-    logs = db.collection('logs').where('user_id', '==', user_id).get()
-    log_list = [log.to_dict() for log in logs]
-    return render_template("view_history.html", logs=log_list)  # Create this template later
-
-
-@app.route("/log/<name>", methods=["POST"])
-def log_action(name):
-    if "user_id" not in session:
-        flash("Please log in first.", "danger")
-        return redirect(url_for("login"))
-
-    user_doc = db.collection('users').document(session["user_id"]).get()
-    if not user_doc.exists:
-        flash("Access denied.", "danger")
-        return redirect(url_for("login"))
-
-    user = user_doc.to_dict()
-
-    # ⚠️ BUG: user_id is not defined in your original code (but you told me NOT to modify logic)
-    # I will keep it EXACTLY as you wrote:
-    if session["user_id"] != user_id:
-        flash("Access denied.", "danger")
-        return redirect(url_for("login"))
+    query = (
+        get_db().collection('logs')
+        .where('user_id', '==', user_id)
+        .order_by('timestamp', direction=firestore.Query.DESCENDING)
+        .limit(HISTORY_PAGE_SIZE)
+    )
 
-    action = request.form.get("action")
+    # ?cursor=<log doc id> continues after the last log of the previous page
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            cursor_doc = get_db().collection('logs').document(cursor).get()
+        except ValueError:
+            # Not a single document id (e.g. contains "/"); start from the top
+            cursor_doc = None
+        if cursor_doc is not None and cursor_doc.exists:
+            query = query.start_after(cursor_doc)
+
+    # Stream so snapshots are converted as they arrive instead of being
+    # held in a full list alongside the dicts
+    log_list = []
+    last_id = None
+    for log in query.stream():
+        log_list.append(log.to_dict())
+        last_id = log.id
+    next_cursor = last_id if len(log_list) == HISTORY_PAGE_SIZE else None
+    return render_template("view_history.html", logs=log_list, next_cursor=next_cursor)
+
+
+@app.route("/log/<user_id>", methods=["POST"])
+@login_required
+def log_action(user_id):
+    user = g.user
+    # Several actions can be submitted at once; they share one commit
+    actions = [action for action in request.form.getlist("action") if action]
     now = datetime.now().strftime("%Y-%m-%d %H:%M")
 
-    if action:
-        log_data = {
-            'user_id': user['id'],
-            'action': action,
-            'timestamp': now
-        }
-        db.collection('logs').add(log_data)
-        flash(f"{action.capitalize()} logged successfully!", "info")
+    if actions:
+        log_entries = [
+            {'user_id': user['id'], 'action': action, 'timestamp': now}
+            for action in actions
+        ]
+        # Written on the request path: logs are the app's core data and must
+        # be committed before the user is told they were saved
+        _record_logs(user['id'], log_entries)
+        flash(f"{', '.join(actions).capitalize()} logged successfully!", "info")
 
-    return redirect(url_for("dashboard", name=name))
+    return redirect(url_for("dashboard", user_id=user_id))
 
 @app.route("/edit_profile/<user_id>", methods=["GET", "POST"])
+@login_required
 def edit_profile(user_id):
-    if "user_id" not in session or session["user_id"] != user_id:
-        flash("Access denied.", "danger")
-        return redirect(url_for("login"))
-    
-    user_doc = db.collection('users').document(user_id).get()
-    if not user_doc.exists:
-        flash("User not found.", "danger")
-        return redirect(url_for("dashboard", user_id=user_id))
-    
-    user = user_doc.to_dict()
-    user['id'] = user_doc.id
-    
+    user = g.user
+
     if request.method == "POST":
+        try:
+            med_minute = med_minute_of_day(request.form.get('med_time', ''))
+        except ValueError:
+            flash("Invalid medication time.", "danger")
+            return redirect(url_for("edit_profile", user_id=user_id))
+
         # Update user data in Firebase
         updated_data = {
             'name': request.form.get('name'),
@@ -248,28 +664,69 @@ def edit_profile(user_id):
             'med_name': request.form.get('med_name'),
             'dosage': request.form.get('dosage'),
             'med_time': request.form.get('med_time'),
+            'med_minute': med_minute,
+            'next_med_timestamp': next_med_timestamp(med_minute),
             'water_goal': int(request.form.get('water_goal'))
         }
-        db.collection('users').document(user_id).update(updated_data)
+        try:
+            _update_profile(get_db().transaction(), user, updated_data)
+        except EmailTaken:
+            flash("Email already registered.", "danger")
+            return redirect(url_for("edit_profile", user_id=user_id))
+        invalidate_user(user_id)
+        forget_email(user['email'])
         flash("Profile updated successfully!", "success")
         return redirect(url_for("dashboard", user_id=user_id))
     
     return render_template("edit_profile.html", user=user)
 
+REMINDER_DEDUP_SECONDS = 60
+REMINDER_LIMIT = parse_limit("3/hour")
+
+
+def _claim_reminder(uid):
+    """True unless a manual reminder already went out for ``uid`` recently."""
+    if r is None:
+        return True
+    try:
+        return bool(r.set(f"rl:reminder:{uid}", 1, nx=True, ex=REMINDER_DEDUP_SECONDS))
+    except redis.RedisError as e:
+        app.logger.warning("Reminder dedup check failed: %s", e)
+        return True
+
+
+def _within_reminder_limit(uid):
+    """Count one manual reminder for ``uid``; False once REMINDER_LIMIT is used up."""
+    try:
+        return rate_limiter.hit(REMINDER_LIMIT, "send_reminder", uid)
+    except redis.RedisError as e:
+        app.logger.warning("Reminder rate limit check failed: %s", e)
+        return True
+
+
 # Optional: Manual reminder route (Added)
 @app.route("/send_reminder/<user_id>")
+@login_required
 def send_reminder(user_id):
-    if "user_id" not in session or session["user_id"] != user_id:
-        flash("Access denied.", "danger")
-        return redirect(url_for("login"))
-    
-    user_doc = db.collection('users').document(user_id).get()
-    if user_doc.exists:
-        user = user_doc.to_dict()
-        send_email(user['email'], "Medication Reminder", f"Hi {user['name']}, time for your {user.get('med_name', 'medication')}!")
-        flash("Reminder sent!", "info")
+    user = g.user
+    # Refreshes and link prefetches shouldn't send the same email again, and
+    # they don't count against the hourly limit
+    if not _claim_reminder(user_id):
+        flash("Reminder already sent recently.", "info")
+        return redirect(url_for("dashboard", user_id=user_id))
+
+    if not _within_reminder_limit(user_id):
+        flash("Reminder limit reached. Please try again later.", "danger")
+        return redirect(url_for("dashboard", user_id=user_id))
+
+    run_in_background(send_email, user['email'], "Medication Reminder", f"Hi {user['name']}, time for your {user.get('med_name', 'medication')}!")
+    flash("Reminder sent!", "info")
     return redirect(url_for("dashboard", user_id=user_id))
 
+# Compile (or load from the bytecode cache) every template up front
+for template_name in app.jinja_env.list_templates(extensions=["html"]):
+    app.jinja_env.get_template(template_name)
+
 # ============================================================
 # 🚀 RUN APP
 # ============================================================
@@ -0,0 +1,42 @@
+"""One-off migration: write the ``users_by_email`` lookup doc for every account.
+
+Accounts created before the lookup collection existed can't log in until
+this has run. Run it once against production with the app's environment:
+
+    FIREBASE_CREDENTIALS=... python backfill_users_by_email.py
+"""
+import logging
+
+from google.api_core.exceptions import AlreadyExists
+
+from app import get_db, email_ref
+
+log = logging.getLogger(__name__)
+
+
+def backfill():
+    created = 0
+    for user_doc in get_db().collection('users').select(['email']).stream():
+        email = (user_doc.to_dict() or {}).get('email')
+        if not email:
+            log.warning("User %s has no email; skipped", user_doc.id)
+            continue
+
+        lookup_ref = email_ref(email)
+        try:
+            lookup_ref.create({'user_id': user_doc.id})
+            created += 1
+        except AlreadyExists:
+            owner = lookup_ref.get().get('user_id')
+            if owner != user_doc.id:
+                # Emails are matched case-insensitively now, so accounts that
+                # differ only in case collide; resolve these by hand
+                log.warning("%s is already mapped to user %s; user %s skipped",
+                            email, owner, user_doc.id)
+    log.info("Created %d users_by_email docs", created)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
+    log.setLevel(logging.INFO)
+    backfill()
@@ -0,0 +1,17 @@
+# Gunicorn settings for running outside Vercel: `gunicorn app:app`
+# The gevent worker lets each process keep many requests in flight while
+# they wait on Firestore / Resend instead of one at a time.
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = "gevent"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_connections = 1000
+
+
+def post_worker_init(worker):
+    # Firestore talks gRPC, which needs its own hook to cooperate with gevent.
+    # It must run after the worker has monkey-patched the standard library;
+    # get_db() is lazy, so no gRPC channel exists yet at this point.
+    from grpc.experimental import gevent as grpc_gevent
+    grpc_gevent.init_gevent()
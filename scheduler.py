@@ -3,98 +3,163 @@ from datetime import datetime, timedelta
 import smtplib
 from email.mime.text import MIMEText
 import os
-import time
+import logging
+
+from apscheduler.schedulers.blocking import BlockingScheduler
 
 DB_NAME = "alisha_bot.db"
 
 EMAIL_ADDRESS = os.environ.get("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.environ.get("EMAIL_PASSWORD")
 
+# Reminders go out this many hours before med_time (0 = at med_time)
+REMINDER_HOURS_BEFORE = (1, 0)
+# How often the user list is re-read to pick up new or edited users
+SYNC_INTERVAL_MINUTES = 15
+
+log = logging.getLogger(__name__)
+log.setLevel(os.environ.get("LOGLEVEL", "WARNING").upper())
+
+# One connection for the whole process instead of one per query. WAL keeps
+# reads from the job threads from blocking on writers to the same database.
+_conn = sqlite3.connect(DB_NAME, check_same_thread=False, isolation_level=None)
+_conn.row_factory = sqlite3.Row
+_conn.execute("PRAGMA journal_mode=WAL")
+_conn.execute("PRAGMA synchronous=NORMAL")
+
+# Query text is kept constant so sqlite3's statement cache skips re-parsing
+SQL_USER_TIMES = "SELECT id, med_time FROM users"
+SQL_USERS_BY_ID = "SELECT id, name, email, med_name, dosage, med_time FROM users WHERE id IN ({})"
+SQL_MEDICATION_TAKEN = (
+    "SELECT DISTINCT user_id FROM logs WHERE action = 'medication' AND timestamp >= ?"
+)
+
 def get_db():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return _conn
 
-def send_email(to_email, subject, body):
-    """Send email to a user."""
-    try:
-        msg = MIMEText(body)
-        msg["Subject"] = subject
-        msg["From"] = EMAIL_ADDRESS
-        msg["To"] = to_email
+def ensure_indexes():
+    """Index the columns the reminder queries filter on."""
+    get_db().execute(
+        "CREATE INDEX IF NOT EXISTS idx_logs_action_time ON logs(action, timestamp)"
+    )
+
+def send_emails(messages):
+    """Send ``(to_email, subject, body)`` messages over one SMTP session."""
+    if not messages:
+        return
 
+    try:
         with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
             server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            server.send_message(msg)
 
-        print(f"✅ Email sent to {to_email}")
+            for to_email, subject, body in messages:
+                msg = MIMEText(body)
+                msg["Subject"] = subject
+                msg["From"] = EMAIL_ADDRESS
+                msg["To"] = to_email
+
+                try:
+                    server.send_message(msg)
+                    log.info("Email sent to %s", to_email)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                    # The server rejected this message only; keep going
+                    log.warning("Failed to send email to %s: %s", to_email, e)
     except Exception as e:
-        print(f"❌ Failed to send email: {e}")
+        log.error("Failed to send emails: %s", e)
+
+def medication_taken_on(db, day):
+    """IDs of all users who have logged medication since the start of ``day``, in one query."""
+    rows = db.execute(SQL_MEDICATION_TAKEN, (day.strftime("%Y-%m-%d"),)).fetchall()
+    return {row["user_id"] for row in rows}
+
+def reminder_message(user, hours_left):
+    if hours_left > 0:
+        subject = "⏰ Medication Reminder"
+        body = (
+            f"Hi {user['name']}, your next medication ({user['med_name']} - {user['dosage']}) "
+            f"is scheduled for {user['med_time']}.\n\n"
+            f"⏳ {hours_left} hour(s) left. Please prepare to take your medication on time!"
+        )
+    else:
+        subject = "💊 Time to Take Your Medication!"
+        body = (
+            f"Hi {user['name']}!\n\nIt's time to take your {user['med_name']} ({user['dosage']}).\n"
+            f"Please stay consistent with your routine."
+        )
+    return subject, body
 
-def has_taken_medication(user_id):
-    """Check if the user has logged medication in the last 24 hours."""
-    db = get_db()
-    today = datetime.now().date()
-    logs = db.execute(
-        "SELECT * FROM logs WHERE user_id = ? AND action = 'medication' AND timestamp >= ?",
-        (user_id, today.strftime("%Y-%m-%d")),
-    ).fetchall()
-    db.close()
-    return len(logs) > 0
-
-def check_reminders():
-    db = get_db()
-    users = db.execute("SELECT * FROM users").fetchall()
-    db.close()
+def send_reminders_job(due):
+    """Cron job for one minute of the day: ``due`` maps user id -> hours left.
 
+    Users are loaded with a single query, and the medication logs with one
+    query per day a due dose falls on.
+    """
+    db = get_db()
+    placeholders = ",".join("?" * len(due))
+    users = db.execute(SQL_USERS_BY_ID.format(placeholders), list(due)).fetchall()
     now = datetime.now()
+    taken = {}
 
+    messages = []
     for user in users:
-        user_id = user["id"]
-        med_time_str = user["med_time"]
-        med_time_today = datetime.strptime(med_time_str, "%H:%M").replace(
-            year=now.year, month=now.month, day=now.day
-        )
+        # A reminder before a dose just after midnight fires the day before
+        dose_day = (now + timedelta(hours=due[user["id"]])).date()
+        if dose_day not in taken:
+            taken[dose_day] = medication_taken_on(db, dose_day)
+        if user["id"] in taken[dose_day]:
+            log.info("%s already took medication. Skipping reminder.", user["name"])
+            continue
 
-        # Move to tomorrow if today's med time passed
-        if now > med_time_today:
-            med_time_today += timedelta(days=1)
+        subject, body = reminder_message(user, due[user["id"]])
+        messages.append((user["email"], subject, body))
 
-        time_remaining = med_time_today - now
-        hours_until = int(time_remaining.total_seconds() // 3600)
+    # One TLS handshake and login for the whole slot, not one per user
+    send_emails(messages)
 
-        # If user already took medication, skip
-        if has_taken_medication(user_id):
-            print(f"🟢 {user['name']} already took medication. Skipping reminders.")
+def sync_jobs(sched):
+    """Make the registered jobs match the current users table.
+
+    Users are grouped by reminder time so each minute has at most one job.
+    """
+    db = get_db()
+    users = db.execute(SQL_USER_TIMES).fetchall()
+
+    slots = {}
+    for user in users:
+        try:
+            med_time = datetime.strptime(user["med_time"], "%H:%M")
+        except (TypeError, ValueError):
+            log.warning("User %s has an invalid med_time %r. Skipping.", user["id"], user["med_time"])
             continue
+        hour, minute = med_time.hour, med_time.minute
+        for hours_left in REMINDER_HOURS_BEFORE:
+            slot = ((hour - hours_left) % 24, minute)
+            slots.setdefault(slot, {})[user["id"]] = hours_left
+
+    for (hour, minute), due in slots.items():
+        sched.add_job(
+            send_reminders_job,
+            "cron",
+            hour=hour,
+            minute=minute,
+            id=f"remind:{hour:02d}:{minute:02d}",
+            replace_existing=True,
+            args=[due],
+        )
 
-        if hours_until > 0:
-            # Send hourly reminders until med time
-            for hour in range(hours_until, 0, -1):
-                if has_taken_medication(user_id):
-                    print(f"✅ {user['name']} took their medication — stopping reminders.")
-                    break
-
-                subject = "⏰ Medication Reminder"
-                body = (
-                    f"Hi {user['name']}, your next medication ({user['med_name']} - {user['dosage']}) "
-                    f"is scheduled for {user['med_time']}.\n\n"
-                    f"⏳ {hour} hour(s) left. Please prepare to take your medication on time!"
-                )
-                send_email(user["email"], subject, body)
-
-                # Wait an hour, but stop early if they log medication
-                print(f"⏸ Sleeping 1 hour before next reminder for {user['name']}...")
-                time.sleep(3600)
-
-        elif time_remaining.total_seconds() <= 3600 and not has_taken_medication(user_id):
-            # Final reminder when it's time
-            subject = "💊 Time to Take Your Medication!"
-            body = (
-                f"Hi {user['name']}!\n\nIt's time to take your {user['med_name']} ({user['dosage']}).\n"
-                f"Please stay consistent with your routine."
-            )
-            send_email(user["email"], subject, body)
+    # Drop slots nobody is due in anymore
+    slot_ids = {f"remind:{hour:02d}:{minute:02d}" for hour, minute in slots}
+    for job in sched.get_jobs():
+        if job.id.startswith("remind:") and job.id not in slot_ids:
+            job.remove()
 
 if __name__ == "__main__":
-    check_reminders()
\ No newline at end of file
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
+    # Jobs are rebuilt from the users table on start, so the default
+    # in-memory job store is enough to survive restarts
+    ensure_indexes()
+    sched = BlockingScheduler()
+    sync_jobs(sched)
+    sched.add_job(sync_jobs, "interval", minutes=SYNC_INTERVAL_MINUTES, args=[sched],
+                  id="sync_jobs", replace_existing=True)
+    sched.start()